@@ -1,2 +1,2 @@
-from .parsing import parse
+from .parsing import parse, Parser
 __version__ = '0.1.0'
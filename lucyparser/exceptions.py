@@ -20,3 +20,18 @@ class LucyUndefinedOperator(BaseLucyException):
 class LucyIllegalLiteral(BaseLucyException):
     def __init__(self, literal):
         super().__init__(f"Illegal literal with escaped slash: {literal}")
+
+
+class LucyIllegalValue(BaseLucyException):
+    def __init__(self, name, value):
+        super().__init__(f"Illegal value for field {name}: {value}")
+
+
+class LucyIllegalPattern(BaseLucyException):
+    def __init__(self, pattern):
+        super().__init__(f"Illegal regular expression: {pattern}")
+
+
+class LucyEmptyLogicalNode(BaseLucyException):
+    def __init__(self, operator):
+        super().__init__(f"Logical operator without operands: {operator}")
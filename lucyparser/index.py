@@ -0,0 +1,194 @@
+import bisect
+import heapq
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .exceptions import LucyUndefinedOperator, LucyIllegalValue, LucyIllegalPattern
+from .tree import BaseNode, ExpressionNode, AndNode, OrNode, NotNode, Operator
+
+DocIds = List[int]
+
+
+def intersect(*postings: DocIds) -> DocIds:
+    """
+    Intersect sorted doc id lists, starting from the smallest one.
+    Every next list is probed with bisect, so the cost depends on the size of the smallest list
+    """
+    if not postings:
+        return []
+    ordered = sorted(postings, key=len)
+    result = ordered[0]
+    for other in ordered[1:]:
+        if not result:
+            break
+        matched = []
+        lo = 0
+        hi = len(other)
+        for doc_id in result:
+            lo = bisect.bisect_left(other, doc_id, lo, hi)
+            if lo == hi:
+                break
+            if other[lo] == doc_id:
+                matched.append(doc_id)
+        result = matched
+    return list(result)
+
+
+def union(*postings: DocIds) -> DocIds:
+    """
+    Merge sorted doc id lists into a single sorted list without duplicates
+    """
+    result: DocIds = []
+    for doc_id in heapq.merge(*postings):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+def difference(postings: DocIds, excluded: DocIds) -> DocIds:
+    if not excluded:
+        return list(postings)
+    excluded_set = set(excluded)
+    return [doc_id for doc_id in postings if doc_id not in excluded_set]
+
+
+class Index:
+    """
+    In-memory index over a static collection of flat documents.
+
+    EQ, NEQ and MATCH are answered from per-field posting lists (term -> sorted doc ids),
+    GT, GTE, LT and LTE from per-field sorted value arrays via bisect.
+    Document ids are positions of documents in the indexed collection.
+
+    Values of documents and values from queries are both passed through a per-field converter
+    (``str`` by default), so e.g. ``converters={"age": int}`` makes range queries on ``age`` numeric.
+    With the default converter range queries compare strings lexically, so "9" > "25".
+    Values the converter fails on, in documents or in queries, raise LucyIllegalValue.
+    So do range queries against a field whose converted values can't be ordered together (e.g. str and int).
+    Bad regular expressions raise LucyIllegalPattern
+    """
+
+    default_converter: Callable[[Any], Any] = str
+
+    def __init__(self, documents: Iterable[Dict[str, Any]], converters: Optional[Dict[str, Callable]] = None):
+        self.converters = converters or {}
+        self.size = 0
+        self._postings: Dict[str, Dict[Any, DocIds]] = {}
+
+        for doc_id, document in enumerate(documents):
+            self.size += 1
+            for name, raw_value in document.items():
+                if raw_value is None:
+                    continue
+                raw_values = raw_value if isinstance(raw_value, (list, tuple, set, frozenset)) else [raw_value]
+                converter = self.get_converter(name)
+                field_postings = self._postings.setdefault(name, {})
+                for value in raw_values:
+                    try:
+                        converted = converter(value)
+                    except (ValueError, TypeError):
+                        raise LucyIllegalValue(name=name, value=value)
+                    doc_ids = field_postings.setdefault(converted, [])
+                    # document ids grow monotonically, so a single check is enough to avoid duplicates
+                    if not doc_ids or doc_ids[-1] != doc_id:
+                        doc_ids.append(doc_id)
+
+        self._all_ids = list(range(self.size))
+        # sorted (values, doc ids) pairs, built on the first range query against a field
+        self._sorted_columns: Dict[str, Tuple[List[Any], DocIds]] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get_converter(self, name: str) -> Callable[[Any], Any]:
+        return self.converters.get(name, self.default_converter)
+
+    def search(self, tree: BaseNode) -> DocIds:
+        """
+        Return sorted ids of documents matching a parsed tree
+        """
+        if isinstance(tree, ExpressionNode):
+            return self.search_expression(tree)
+        if isinstance(tree, AndNode):
+            return self.search_and(tree)
+        if isinstance(tree, OrNode):
+            return union(*[self.search(child) for child in tree.children])
+        if isinstance(tree, NotNode):
+            return difference(self._all_ids, union(*[self.search(child) for child in tree.children]))
+        raise LucyUndefinedOperator(operator=type(tree).__name__)
+
+    def search_and(self, tree: AndNode) -> DocIds:
+        """
+        Intersect positive children and subtract negated ones,
+        so `a: 1 AND NOT b: 2` never materializes a complement
+        """
+        included = [self.search(child) for child in tree.children if not isinstance(child, NotNode)]
+        excluded = [self.search(grandchild) for child in tree.children if isinstance(child, NotNode)
+                    for grandchild in child.children]
+        result = intersect(*included) if included else list(self._all_ids)
+        if excluded:
+            result = difference(result, union(*excluded))
+        return result
+
+    def search_expression(self, node: ExpressionNode) -> DocIds:
+        name = node.name or ""
+        operator = node.operator
+
+        if operator == Operator.MATCH:
+            return self.search_match(name=name, pattern=node.value)
+
+        try:
+            value = self.get_converter(name)(node.value)
+        except (ValueError, TypeError):
+            raise LucyIllegalValue(name=name, value=node.value)
+
+        if operator == Operator.EQ:
+            return list(self._postings.get(name, {}).get(value, []))
+        if operator == Operator.NEQ:
+            return difference(self._all_ids, self._postings.get(name, {}).get(value, []))
+        if operator in (Operator.GT, Operator.GTE, Operator.LT, Operator.LTE):
+            return self.search_range(name=name, operator=operator, value=value)
+        raise LucyUndefinedOperator(operator=operator)
+
+    def search_range(self, name: str, operator: Operator, value: Any) -> DocIds:
+        values, doc_ids = self._get_sorted_column(name)
+        try:
+            if operator == Operator.GT:
+                matched = doc_ids[bisect.bisect_right(values, value):]
+            elif operator == Operator.GTE:
+                matched = doc_ids[bisect.bisect_left(values, value):]
+            elif operator == Operator.LT:
+                matched = doc_ids[:bisect.bisect_left(values, value)]
+            elif operator == Operator.LTE:
+                matched = doc_ids[:bisect.bisect_right(values, value)]
+            else:
+                raise LucyUndefinedOperator(operator=operator)
+        except TypeError:
+            raise LucyIllegalValue(name=name, value=value)
+        return sorted(set(matched))
+
+    def search_match(self, name: str, pattern: str) -> DocIds:
+        """
+        Regular expressions can't use postings directly, but they only have to be checked
+        against distinct terms of a field instead of every document
+        """
+        try:
+            regex = re.compile(pattern)
+        except re.error:
+            raise LucyIllegalPattern(pattern=pattern)
+        field_postings = self._postings.get(name, {})
+        return union(*[doc_ids for term, doc_ids in field_postings.items() if regex.fullmatch(str(term))])
+
+    def _get_sorted_column(self, name: str) -> Tuple[List[Any], DocIds]:
+        column = self._sorted_columns.get(name)
+        if column is None:
+            try:
+                pairs = sorted(
+                    ((value, doc_id) for value, doc_ids in self._postings.get(name, {}).items() for doc_id in doc_ids),
+                    key=lambda pair: pair[0],
+                )
+            except TypeError as e:
+                raise LucyIllegalValue(name=name, value=f"values are not comparable ({e})")
+            column = ([value for value, _ in pairs], [doc_id for _, doc_id in pairs])
+            self._sorted_columns[name] = column
+        return column
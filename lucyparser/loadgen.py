@@ -0,0 +1,224 @@
+"""
+Load generator for lucyparser.server. Reports throughput, p50/p99 latency and the server cache hit rate.
+
+Run with `python -m lucyparser.loadgen --port 8765 --connections 16 --requests 20000 --unique`.
+Without --unique the same few queries repeat and mostly measure the result cache
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+DEFAULT_QUERIES = [
+    "a: {n}",
+    "a: {n} AND b > 2",
+    "name: 'value {n}' OR (age >= 18 AND NOT city: london)",
+    "x: [1, 2, {n}] AND y ~ 'prefix.*'",
+    "a: {n} AND",  # invalid on purpose
+]
+
+
+@dataclass
+class Report:
+    requests: int
+    errors: int
+    elapsed: float
+    latencies: List[float]
+    cache_hits: Optional[int] = None
+    cache_misses: Optional[int] = None
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cache_hit_rate(self) -> Optional[float]:
+        if self.cache_hits is None or self.cache_misses is None:
+            return None
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def percentile(self, percent: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        position = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[position]
+
+    def format(self) -> str:
+        formatted = (
+            f"requests: {self.requests}, errors: {self.errors}, elapsed: {self.elapsed:.2f}s, "
+            f"throughput: {self.throughput:.0f} req/s, "
+            f"p50: {self.percentile(50) * 1000:.2f}ms, p99: {self.percentile(99) * 1000:.2f}ms"
+        )
+        if self.cache_hit_rate is not None:
+            formatted += f", cache hit rate: {self.cache_hit_rate:.1%}"
+        return formatted
+
+
+def make_query(template: str, n: int) -> str:
+    """
+    `{n}` in a query template is replaced with a request number, so queries can be unique
+    """
+    return template.replace("{n}", str(n))
+
+
+async def run_connection(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        requests: int,
+        pipeline: int,
+        queries: List[str],
+        method: str,
+        latencies: List[float],
+        unique_from: Optional[int] = None,
+) -> int:
+    """
+    Keep up to `pipeline` requests in flight on a single connection. Returns the number of failed requests:
+    error responses, responses which can't be matched to a request and requests left unanswered
+    when the server closes the connection.
+    With `unique_from` every request gets a unique number for query templates, starting from it
+    """
+    sent_at: Dict[Any, float] = {}
+    errors = 0
+    window = asyncio.Semaphore(pipeline)
+
+    async def send():
+        for request_id in range(requests):
+            await window.acquire()
+            n = 0 if unique_from is None else unique_from + request_id
+            query = make_query(random.choice(queries), n)
+            line = json.dumps({"id": request_id, "method": method, "query": query})
+            sent_at[request_id] = time.perf_counter()
+            writer.write(line.encode() + b"\n")
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    try:
+        for answered in range(requests):
+            line = await reader.readline()
+            if not line:
+                errors += requests - answered
+                break
+            window.release()
+            try:
+                response = json.loads(line)
+                started = sent_at.pop(response.get("id"), None)
+            except (ValueError, AttributeError, TypeError):
+                started = None
+            if started is None:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if "error" in response:
+                errors += 1
+    finally:
+        if not sender.done():
+            sender.cancel()
+        try:
+            await sender
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+    return errors
+
+
+async def open_connection(host: str, port: int, unix: Optional[str]):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def fetch_stats(host: str, port: int, unix: Optional[str]) -> Optional[Dict[str, int]]:
+    reader, writer = await open_connection(host, port, unix)
+    try:
+        writer.write(json.dumps({"id": "stats", "method": "stats"}).encode() + b"\n")
+        response = json.loads(await reader.readline() or b"{}")
+    except (ValueError, ConnectionError):
+        return None
+    finally:
+        writer.close()
+    return response.get("result")
+
+
+async def generate_load(
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        unix: Optional[str] = None,
+        connections: int = 8,
+        requests: int = 10000,
+        pipeline: int = 16,
+        queries: Optional[List[str]] = None,
+        method: str = "to_dict",
+        unique: bool = False,
+) -> Report:
+    """
+    Without `unique` every `{n}` in query templates is 0, so after the first few requests
+    the server answers from its result cache. With `unique` every request has its own number
+    and goes through parsing, batching and the worker pool
+    """
+    queries = queries or DEFAULT_QUERIES
+    latencies: List[float] = []
+    streams = [await open_connection(host, port, unix) for _ in range(connections)]
+    stats_before = await fetch_stats(host, port, unix)
+
+    per_connection = [requests // connections + (1 if i < requests % connections else 0) for i in range(connections)]
+    unique_from = [sum(per_connection[:i]) for i in range(connections)]
+    started = time.perf_counter()
+    errors = await asyncio.gather(*[
+        run_connection(reader, writer, count, pipeline, queries, method, latencies, first if unique else None)
+        for (reader, writer), count, first in zip(streams, per_connection, unique_from)
+    ])
+    elapsed = time.perf_counter() - started
+
+    for _, writer in streams:
+        writer.close()
+
+    report = Report(requests=requests, errors=sum(errors), elapsed=elapsed, latencies=latencies)
+    stats_after = await fetch_stats(host, port, unix)
+    if stats_before and stats_after:
+        report.cache_hits = stats_after["cache_hits"] - stats_before["cache_hits"]
+        report.cache_misses = (
+            stats_after["processed"] + stats_after["coalesced"]
+            - stats_before["processed"] - stats_before["coalesced"]
+        )
+    return report
+
+
+def get_arguments_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load generator for the lucy query parsing service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Connect to a unix socket instead of TCP")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10000, help="Total number of requests")
+    parser.add_argument("--pipeline", type=int, default=16, help="Requests in flight per connection")
+    parser.add_argument("--method", default="to_dict", choices=["validate", "to_dict", "parse"])
+    parser.add_argument("--queries", help="File with one query template per line, {n} is replaced with a number")
+    parser.add_argument(
+        "--unique", action="store_true",
+        help="Give every request its own {n}, so responses don't come from the server cache",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_arguments_parser().parse_args()
+    queries = None
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    report = asyncio.run(generate_load(
+        host=args.host,
+        port=args.port,
+        unix=args.unix,
+        connections=args.connections,
+        requests=args.requests,
+        pipeline=args.pipeline,
+        queries=queries,
+        method=args.method,
+        unique=args.unique,
+    ))
+    print(report.format())
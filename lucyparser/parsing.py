@@ -12,18 +12,15 @@ def parse(string: str, parser_class: Optional[Callable] = None) -> BaseNode:
     User facing parse function. All user needs to know about
     """
     if parser_class is None:
-        parser_class = Parser
-    cursor = Cursor(string)
-    cursor.consume_spaces()
-    parser = parser_class()
-    tree = parser.read_tree(cursor)
-    cursor.consume_spaces()
-    if not cursor.empty():
-        raise LucyUnexpectedEndException()
-    return tree
+        return default_parser.parse(string)
+    return parser_class().parse(string)
 
 
 class Parser:
+    """
+    Parser instances keep no state between calls: all the per-call state lives in a Cursor,
+    so a single instance can be created upfront and shared between threads
+    """
     name_chars = string.ascii_letters + string.digits + "_."
     name_first_chars = string.ascii_letters + "_"
     value_chars = string.ascii_letters + string.digits + "-.*_?!;:@|"
@@ -40,6 +37,15 @@ class Parser:
         "v": "\v"
     }
 
+    def parse(self, string: str) -> BaseNode:
+        cursor = Cursor(string)
+        cursor.consume_spaces()
+        tree = self.read_tree(cursor)
+        cursor.consume_spaces()
+        if not cursor.empty():
+            raise LucyUnexpectedEndException()
+        return tree
+
     def permitted_name_char(self, c: str) -> bool:
         return c in self.name_chars
 
@@ -238,3 +244,6 @@ class Parser:
 
         cur.consume_known_char("]")
         return values
+
+
+default_parser = Parser()
@@ -0,0 +1,378 @@
+"""
+Asyncio parse/validate service speaking JSON lines over TCP or a Unix socket.
+
+Every request is a single line:
+    {"id": 1, "method": "validate", "query": "a: 1 AND b > 2"}
+and gets a single line in response (responses may come out of order, match them by id):
+    {"id": 1, "result": {"valid": true}}
+    {"id": 2, "error": "Unexpected end of input"}
+
+Supported methods are "validate", "to_dict" and "parse". The dict form is the only
+representation of a tree usable outside of Python, so "parse" is an alias for "to_dict".
+{"id": 1, "method": "stats"} returns result cache counters.
+
+Run with `python -m lucyparser.server --port 8765` or `python -m lucyparser.server --unix /tmp/lucy.sock`
+"""
+import argparse
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .exceptions import BaseLucyException
+from .parsing import parse
+
+RequestKey = Tuple[str, str]
+
+METHODS = ("validate", "to_dict", "parse")
+
+
+def handle_request(method: str, query: str) -> Dict:
+    try:
+        tree = parse(query)
+    except BaseLucyException as e:
+        if method == "validate":
+            return {"result": {"valid": False, "error": str(e)}}
+        return {"error": str(e)}
+
+    if method == "validate":
+        return {"result": {"valid": True}}
+    return {"result": tree.to_dict()}
+
+
+def handle_batch(requests: List[RequestKey]) -> List[Dict]:
+    """
+    Runs in a worker, so it has to stay a picklable module level function
+    """
+    responses = []
+    for method, query in requests:
+        try:
+            responses.append(handle_request(method=method, query=query))
+        except Exception as e:
+            responses.append({"error": f"Internal error: {e}", "internal": True})
+    return responses
+
+
+class Server:
+    """
+    Requests missing in the shared result cache are collected into micro-batches
+    of up to `max_batch_size` requests (waiting at most `batch_delay` seconds for a batch to fill)
+    and processed in `executor`. Identical requests in flight are processed once.
+
+    Backpressure: at most `max_pending` requests wait for a batch and at most `max_batches`
+    batches run at once. When both are exhausted connections stop being read.
+
+    Lines longer than `line_limit` bytes are skipped and answered with a "Bad request" error.
+    The executor is shut down on close only if the server created it.
+    """
+
+    shutdown_response = {"error": "Server is shutting down"}
+
+    def __init__(
+            self,
+            executor: Optional[Executor] = None,
+            max_batches: int = 4,
+            max_batch_size: int = 64,
+            batch_delay: float = 0.001,
+            max_pending: int = 1024,
+            cache_size: int = 10000,
+            line_limit: int = 2 ** 20,
+    ):
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_batches)
+        self.max_batches = max_batches
+        self.max_batch_size = max_batch_size
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.line_limit = line_limit
+
+        self._cache: "OrderedDict[RequestKey, Dict]" = OrderedDict()
+        self.stats = {"cache_hits": 0, "coalesced": 0, "processed": 0}
+        self._in_flight: Dict[RequestKey, asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Future] = set()
+        self._connections: Set[asyncio.Task] = set()
+        self._closing = False
+        self._closed: Optional[asyncio.Event] = None
+        self._servers: List[asyncio.base_events.Server] = []
+        self._unix_paths: List[str] = []
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.base_events.Server:
+        self._start_batcher()
+        server = await asyncio.start_server(self.handle_connection, host=host, port=port, limit=self.line_limit)
+        self._servers.append(server)
+        return server
+
+    async def start_unix(self, path: str) -> asyncio.base_events.Server:
+        self._start_batcher()
+        server = await asyncio.start_unix_server(self.handle_connection, path=path, limit=self.line_limit)
+        self._servers.append(server)
+        self._unix_paths.append(path)
+        return server
+
+    async def close(self):
+        """
+        Stop accepting connections, let running batches finish, fail requests still waiting
+        for a batch, and close open connections once their responses are written
+        """
+        self._closing = True
+        if self._closed is not None:
+            self._closed.set()
+        for server in self._servers:
+            server.close()
+
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+        for future in self._in_flight.values():
+            if not future.done():
+                future.set_result(self.shutdown_response)
+        self._in_flight.clear()
+
+        # connections stop reading and exit once their responses are written.
+        # Draining the queue releases the ones waiting for a free slot in it
+        while self._connections:
+            while self._queue is not None and not self._queue.empty():
+                self._queue.get_nowait()
+            await asyncio.wait(list(self._connections), timeout=0.01)
+
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        for path in self._unix_paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._unix_paths = []
+
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    def _start_batcher(self):
+        if self._batcher is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._batch_slots = asyncio.Semaphore(self.max_batches)
+            self._closed = asyncio.Event()
+            self._batcher = asyncio.ensure_future(self._run_batcher())
+
+    async def submit(self, method: str, query: str) -> "asyncio.Future[Dict]":
+        """
+        Return a future with the response for a request.
+        Waits only when the pending queue is full
+        """
+        key = (method, query)
+        loop = asyncio.get_running_loop()
+
+        if self._closing:
+            future = loop.create_future()
+            future.set_result(self.shutdown_response)
+            return future
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            self._cache.move_to_end(key)
+            future = loop.create_future()
+            future.set_result(cached)
+            return future
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.stats["coalesced"] += 1
+            return in_flight
+
+        self.stats["processed"] += 1
+
+        future = loop.create_future()
+        self._in_flight[key] = future
+        await self._queue.put(key)  # type: ignore
+        return future
+
+    async def _run_batcher(self):
+        queue: asyncio.Queue = self._queue  # type: ignore
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < self.max_batch_size:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.max_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._batch_slots.acquire()  # type: ignore
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[RequestKey]):
+        loop = asyncio.get_running_loop()
+        try:
+            responses = await loop.run_in_executor(self.executor, handle_batch, batch)
+        except Exception as e:
+            responses = [{"error": f"Internal error: {e}", "internal": True} for _ in batch]
+        finally:
+            self._batch_slots.release()  # type: ignore
+
+        for key, response in zip(batch, responses):
+            # parse errors are as deterministic as results, failures of workers are not
+            if response.pop("internal", False) is False:
+                self._remember(key, response)
+            future = self._in_flight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    def _remember(self, key: RequestKey, response: Dict):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = response
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _read_line(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """
+        Read a single line. Returns None for lines longer than `line_limit`, skipping them entirely
+        """
+        try:
+            return await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+        while True:
+            try:
+                await reader.readexactly(consumed)
+                await reader.readuntil(b"\n")
+                return None
+            except asyncio.IncompleteReadError:
+                return None
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = asyncio.current_task()
+        self._connections.add(connection)  # type: ignore
+        closed = asyncio.ensure_future(self._closed.wait())  # type: ignore
+        write_lock = asyncio.Lock()
+        responders = set()
+
+        async def respond(request_id: Any, response: Dict):
+            line = json.dumps({"id": request_id, **response}).encode() + b"\n"
+            async with write_lock:
+                writer.write(line)
+                await writer.drain()
+
+        async def respond_when_done(request_id: Any, future: "asyncio.Future[Dict]"):
+            await respond(request_id, await future)
+
+        try:
+            while True:
+                reading = asyncio.ensure_future(self._read_line(reader))
+                await asyncio.wait([reading, closed], return_when=asyncio.FIRST_COMPLETED)
+                if not reading.done():
+                    reading.cancel()
+                    break
+                line = reading.result()
+                if line is None:
+                    await respond(None, {"error": f"Bad request: line is longer than {self.line_limit} bytes"})
+                    continue
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    method = request["method"]
+                    if method == "stats":
+                        await respond(request_id, {"result": dict(self.stats)})
+                        continue
+                    query = request["query"]
+                    if method not in METHODS:
+                        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+                    if not isinstance(query, str):
+                        raise ValueError("Query must be a string")
+                except (ValueError, KeyError, AttributeError) as e:
+                    await respond(request_id, {"error": f"Bad request: {e}"})
+                    continue
+
+                future = await self.submit(method=method, query=query)
+                if future.done():
+                    await respond(request_id, future.result())
+                else:
+                    responder = asyncio.ensure_future(respond_when_done(request_id, future))
+                    responders.add(responder)
+                    responder.add_done_callback(responders.discard)
+
+            if responders:
+                await asyncio.gather(*responders, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for responder in responders:
+                responder.cancel()
+            writer.close()
+            closed.cancel()
+            self._connections.discard(connection)  # type: ignore
+
+
+async def serve(args: argparse.Namespace):
+    if args.processes:
+        executor: Executor = ProcessPoolExecutor(max_workers=args.workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    server = Server(
+        executor=executor,
+        max_batches=args.workers,
+        max_batch_size=args.batch_size,
+        batch_delay=args.batch_delay,
+        max_pending=args.max_pending,
+        cache_size=args.cache_size,
+        line_limit=args.line_limit,
+    )
+    if args.unix:
+        listener = await server.start_unix(args.unix)
+    else:
+        listener = await server.start_tcp(host=args.host, port=args.port)
+    print("Listening on", ", ".join(str(sock.getsockname()) for sock in listener.sockets))
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+        executor.shutdown(wait=False)
+
+
+def get_arguments_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Lucy query parsing service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Listen on a unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers and concurrently running batches")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of threads")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batch-delay", type=float, default=0.001, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--line-limit", type=int, default=2 ** 20, help="Maximum request line length in bytes")
+    return parser
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(get_arguments_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,171 @@
+import functools
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+from .exceptions import LucyUndefinedOperator, LucyEmptyLogicalNode
+from .tree import BaseNode, ExpressionNode, AndNode, OrNode, NotNode, Operator, LogicalOperator
+
+
+@dataclass
+class Translation:
+    template: str
+    params: Union[List[Any], Dict[str, Any]]
+
+
+def get_shape(tree: BaseNode) -> Hashable:
+    """
+    Structure of a tree without values. Trees which differ only in values have equal shapes
+    """
+    if isinstance(tree, ExpressionNode):
+        return ("expr", tree.name, tree.operator)
+    if isinstance(tree, (AndNode, OrNode, NotNode)):
+        if not tree.children:
+            raise LucyEmptyLogicalNode(operator=tree.operator)
+        return (tree.operator, tuple(get_shape(child) for child in tree.children))
+    raise LucyUndefinedOperator(operator=type(tree).__name__)
+
+
+def get_values(tree: BaseNode) -> List[Any]:
+    """
+    Values of a tree in depth-first order, the same order templates reference them in
+    """
+    if isinstance(tree, ExpressionNode):
+        return [tree.value]
+    values = []
+    for child in tree.children:  # type: ignore
+        values.extend(get_values(child))
+    return values
+
+
+class BaseTranslator:
+    """
+    Translates a tree into a parameterized template and a separate list of parameters.
+    Templates are rendered from the tree shape only and cached by it,
+    so queries differing only in values share the very same template string
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.render = functools.lru_cache(maxsize=cache_size)(self.render_shape)
+
+    def translate(self, tree: BaseNode) -> Translation:
+        template = self.render(get_shape(tree))
+        return Translation(template=template, params=get_values(tree))
+
+    def render_shape(self, shape: Hashable) -> str:
+        raise NotImplementedError
+
+
+class SQLTranslator(BaseTranslator):
+    """
+    Renders a WHERE clause body. Supports DB-API "qmark" (?), "format" (%s) and "numeric" ($1) paramstyles.
+
+    Regular expression matching has no portable SQL, so MATCH raises LucyUndefinedOperator
+    unless `match_operator` is given, e.g. "~" for PostgreSQL or "REGEXP" for MySQL and SQLite.
+    Matching semantics are then the database's: both of these search unanchored,
+    unlike ElasticsearchTranslator and Index which match the whole value
+    """
+
+    operators = {
+        Operator.EQ: "=",
+        Operator.NEQ: "<>",
+        Operator.GT: ">",
+        Operator.GTE: ">=",
+        Operator.LT: "<",
+        Operator.LTE: "<=",
+    }
+    paramstyles = ("qmark", "format", "numeric")
+
+    def __init__(self, paramstyle: str = "qmark", match_operator: Optional[str] = None, cache_size: int = 1024):
+        if paramstyle not in self.paramstyles:
+            raise ValueError(f"Unsupported paramstyle {paramstyle}, expected one of {self.paramstyles}")
+        self.paramstyle = paramstyle
+        self.operators = dict(self.operators)
+        if match_operator is not None:
+            self.operators[Operator.MATCH] = match_operator
+        super().__init__(cache_size=cache_size)
+
+    def quote_name(self, name: str) -> str:
+        return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+    def placeholder(self, position: int) -> str:
+        if self.paramstyle == "qmark":
+            return "?"
+        if self.paramstyle == "format":
+            return "%s"
+        return f"${position}"
+
+    def render_shape(self, shape: Hashable) -> str:
+        counter = [0]
+
+        def render(node_shape) -> str:
+            if node_shape[0] == "expr":
+                _, name, operator = node_shape
+                counter[0] += 1
+                sql_operator = self.operators.get(operator)
+                if sql_operator is None:
+                    raise LucyUndefinedOperator(operator=operator)
+                return f"{self.quote_name(name)} {sql_operator} {self.placeholder(counter[0])}"
+
+            operator, children = node_shape
+            rendered = [render(child) for child in children]
+            if operator == LogicalOperator.NOT:
+                return "NOT (" + " AND ".join(rendered) + ")"
+            return "(" + f" {operator.name} ".join(rendered) + ")"
+
+        return render(shape)
+
+
+class ElasticsearchTranslator(BaseTranslator):
+    """
+    Renders a bool query as an Elasticsearch search template source with mustache placeholders.
+    Params are returned as a dict, ready for `{"source": template, "params": params}`.
+    MATCH becomes a `regexp` query, which is anchored: the pattern has to match the whole term
+    """
+
+    range_operators = {
+        Operator.GT: "gt",
+        Operator.GTE: "gte",
+        Operator.LT: "lt",
+        Operator.LTE: "lte",
+    }
+
+    def translate(self, tree: BaseNode) -> Translation:
+        translation = super().translate(tree)
+        translation.params = {self.param_name(position): value for position, value in enumerate(translation.params)}
+        return translation
+
+    def param_name(self, position: int) -> str:
+        return f"p{position}"
+
+    def render_shape(self, shape: Hashable) -> str:
+        counter = [0]
+
+        def render(node_shape) -> Dict:
+            if node_shape[0] == "expr":
+                _, name, operator = node_shape
+                placeholder = "{{" + self.param_name(counter[0]) + "}}"
+                counter[0] += 1
+                return self.render_expression(name=name, operator=operator, placeholder=placeholder)
+
+            operator, children = node_shape
+            rendered = [render(child) for child in children]
+            if operator == LogicalOperator.AND:
+                return {"bool": {"must": rendered}}
+            if operator == LogicalOperator.OR:
+                return {"bool": {"should": rendered, "minimum_should_match": 1}}
+            return {"bool": {"must_not": [{"bool": {"must": rendered}}] if len(rendered) > 1 else rendered}}
+
+        return json.dumps(render(shape), sort_keys=True)
+
+    def render_expression(self, name: str, operator: Operator, placeholder: str) -> Dict:
+        if operator == Operator.EQ:
+            return {"term": {name: placeholder}}
+        if operator == Operator.NEQ:
+            return {"bool": {"must_not": [{"term": {name: placeholder}}]}}
+        if operator == Operator.MATCH:
+            return {"regexp": {name: placeholder}}
+        range_operator = self.range_operators.get(operator)
+        if range_operator is None:
+            raise LucyUndefinedOperator(operator=operator)
+        return {"range": {name: {range_operator: placeholder}}}
@@ -0,0 +1,96 @@
+import pytest
+
+from lucyparser import parse
+from lucyparser.exceptions import LucyIllegalValue, LucyIllegalPattern
+from lucyparser.index import Index, intersect, union, difference
+
+DOCUMENTS = [
+    {"name": "alice", "age": 31, "city": "london", "tags": ["admin", "dev"]},
+    {"name": "bob", "age": 25, "city": "paris", "tags": ["dev"]},
+    {"name": "carol", "age": 42, "city": "london"},
+    {"name": "dave", "age": 25, "city": "berlin", "tags": ["ops"]},
+    {"name": "eve", "age": 9, "city": None},
+]
+
+
+@pytest.fixture
+def index():
+    return Index(DOCUMENTS, converters={"age": int})
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("city: london", [0, 2]),
+        ("city: nowhere", []),
+        ("unknown_field: x", []),
+        ("city ! london", [1, 3, 4]),
+        ("age: 25", [1, 3]),
+        ("age > 25", [0, 2]),
+        ("age >= 25", [0, 1, 2, 3]),
+        ("age < 25", [4]),
+        ("age <= 25", [1, 3, 4]),
+        ("tags: dev", [0, 1]),
+        ("name ~ '.*o.*'", [1, 2]),
+        ("city: london AND age > 35", [2]),
+        ("city: london OR city: paris", [0, 1, 2]),
+        ("city: [paris, berlin]", [1, 3]),
+        ("NOT city: london", [1, 3, 4]),
+        ("NOT tags: dev AND NOT city: london", [3, 4]),
+        ("age >= 25 AND NOT (city: london)", [1, 3]),
+        ("(city: london OR tags: ops) AND age < 40", [0, 3]),
+    ],
+)
+def test_search(index, query, expected):
+    assert index.search(parse(query)) == expected
+
+
+def test_search_matches_full_scan(index):
+    query = "age >= 25 AND (city: london OR tags: dev) AND NOT name: carol"
+    expected = [
+        doc_id for doc_id, doc in enumerate(DOCUMENTS)
+        if doc["age"] >= 25 and (doc["city"] == "london" or "dev" in doc.get("tags", [])) and doc["name"] != "carol"
+    ]
+    assert index.search(parse(query)) == expected
+
+
+def test_default_converter_is_str():
+    index = Index([{"x": 1}, {"x": 2}])
+    assert index.search(parse("x: 2")) == [1]
+    assert len(index) == 2
+
+
+def test_set_operations():
+    assert intersect([1, 2, 3, 7, 9], [2, 9], [0, 2, 5, 9, 11]) == [2, 9]
+    assert intersect([1, 2], []) == []
+    assert union([1, 5], [2, 5, 8], []) == [1, 2, 5, 8]
+    assert difference([1, 2, 3, 4], [2, 4]) == [1, 3]
+
+
+@pytest.mark.parametrize("query", ["city: london", "age > 25", "NOT city: london", "tags: dev AND NOT city: paris"])
+def test_results_do_not_share_index_state(index, query):
+    expected = index.search(parse(query))
+    index.search(parse(query)).clear()
+    assert index.search(parse(query)) == expected
+
+
+def test_illegal_query_values(index):
+    with pytest.raises(LucyIllegalValue):
+        index.search(parse("age > x"))
+    with pytest.raises(LucyIllegalPattern):
+        index.search(parse("name ~ '('"))
+
+
+def test_illegal_document_values():
+    with pytest.raises(LucyIllegalValue):
+        Index([{"age": "x"}], converters={"age": int})
+
+    index = Index([{"x": 1}, {"x": "a"}], converters={"x": lambda value: value})
+    assert index.search(parse("x: a")) == [1]
+    with pytest.raises(LucyIllegalValue):
+        index.search(parse("x > a"))
+
+
+def test_default_converter_compares_ranges_lexically():
+    index = Index([{"x": 9}, {"x": 25}])
+    assert index.search(parse("x > 25")) == [0]
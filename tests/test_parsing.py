@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from lucyparser import parse
+from lucyparser import parse, Parser
+from lucyparser.exceptions import LucyUnexpectedCharacter
 from lucyparser.parsing import Cursor
 from lucyparser.tree import ExpressionNode, Operator, NotNode, AndNode, OrNode
 
@@ -220,3 +223,53 @@ def test_to_dict():
             {'type': 'expr', 'operator': 'eq', 'name': 'field2', 'value': 'value2'}
         ]
     }
+
+
+class DollarParser(Parser):
+    value_chars = Parser.value_chars + "$"
+
+
+def test_parser_subclass():
+    with pytest.raises(LucyUnexpectedCharacter):
+        parse("a: $1")
+    assert parse("a: $1", parser_class=DollarParser) == ExpressionNode(operator=Operator.EQ, name="a", value="$1")
+    assert DollarParser().parse("a: $1") == ExpressionNode(operator=Operator.EQ, name="a", value="$1")
+
+
+class CustomInitParser(DollarParser):
+    def __init__(self, option):
+        self.option = option
+
+
+def test_parser_subclass_with_own_init():
+    assert CustomInitParser(option=1).parse("a: $1") == ExpressionNode(operator=Operator.EQ, name="a", value="$1")
+
+
+class InstanceConfiguredParser(Parser):
+    def __init__(self):
+        self.value_chars = Parser.value_chars + "$"
+
+
+def test_parser_configured_per_instance():
+    assert InstanceConfiguredParser().parse("a: $1") == ExpressionNode(operator=Operator.EQ, name="a", value="$1")
+    assert parse("a: $1", parser_class=InstanceConfiguredParser) == ExpressionNode(
+        operator=Operator.EQ, name="a", value="$1"
+    )
+
+
+def test_parser_class_configured_after_definition():
+    class LateParser(Parser):
+        pass
+
+    LateParser.value_chars += "$"
+    assert LateParser().parse("a: $1") == ExpressionNode(operator=Operator.EQ, name="a", value="$1")
+
+
+def test_shared_parser_in_threads():
+    parser = DollarParser()
+    queries = [f"a: ${i} AND (b > {i} OR NOT c: 'x {i}')" for i in range(200)]
+    expected = [parser.parse(query) for query in queries]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(10):
+            assert list(executor.map(parser.parse, queries)) == expected
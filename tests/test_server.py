@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lucyparser import parse, server as server_module
+from lucyparser.loadgen import generate_load
+from lucyparser.server import Server
+
+
+async def request_lines(port, lines):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for line in lines:
+        writer.write(line.encode() + b"\n")
+    await writer.drain()
+    responses = [json.loads(await reader.readline()) for _ in lines]
+    writer.close()
+    return {response["id"]: response for response in responses}
+
+
+def run_with_server(coroutine_factory, **server_kwargs):
+    async def main():
+        server = Server(**server_kwargs)
+        listener = await server.start_tcp()
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            return server, await coroutine_factory(port)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_methods():
+    lines = [
+        json.dumps({"id": 1, "method": "to_dict", "query": "a: 1 OR b: 2"}),
+        json.dumps({"id": 2, "method": "parse", "query": "a: 1"}),
+        json.dumps({"id": 3, "method": "validate", "query": "a: 1"}),
+        json.dumps({"id": 4, "method": "validate", "query": "a: 1 AND"}),
+        json.dumps({"id": 5, "method": "to_dict", "query": "a: 1 AND"}),
+        json.dumps({"id": 6, "method": "unknown", "query": "a: 1"}),
+        "not json",
+    ]
+    _, responses = run_with_server(lambda port: request_lines(port, lines))
+
+    assert responses[1] == {"id": 1, "result": parse("a: 1 OR b: 2").to_dict()}
+    assert responses[2] == {"id": 2, "result": parse("a: 1").to_dict()}
+    assert responses[3] == {"id": 3, "result": {"valid": True}}
+    assert responses[4] == {"id": 4, "result": {"valid": False, "error": "Unexpected end of input"}}
+    assert responses[5] == {"id": 5, "error": "Unexpected end of input"}
+    assert responses[6]["error"].startswith("Bad request")
+    assert responses[None]["error"].startswith("Bad request")
+
+
+def test_batching_and_cache():
+    lines = [json.dumps({"id": i, "method": "to_dict", "query": f"a: {i % 10}"}) for i in range(200)]
+    server, responses = run_with_server(lambda port: request_lines(port, lines), max_batches=1, max_pending=8)
+
+    for i in range(200):
+        assert responses[i]["result"] == parse(f"a: {i % 10}").to_dict()
+    assert len(server._cache) == 10
+
+
+def test_load_generator():
+    _, report = run_with_server(lambda port: generate_load(port=port, connections=4, requests=400, pipeline=8))
+
+    assert report.requests == 400
+    assert 0 < report.errors < 400  # default queries include an invalid one
+    assert 0 < report.percentile(50) <= report.percentile(99)
+    assert report.cache_hit_rate > 0.9
+
+
+def test_load_generator_unique_queries():
+    _, report = run_with_server(
+        lambda port: generate_load(port=port, connections=4, requests=400, pipeline=8, unique=True)
+    )
+
+    assert report.requests == 400
+    assert len(report.latencies) == 400
+    assert report.cache_hits == 0
+    assert report.cache_hit_rate == 0
+
+
+def test_load_generator_survives_unmatched_responses_and_eof():
+    async def handle(reader, writer):
+        line = await reader.readline()
+        if json.loads(line).get("method") == "stats":
+            writer.close()
+            return
+        # answer the first request without an id, like a bad request, then hang up
+        writer.write(json.dumps({"id": None, "error": "Bad request"}).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        listener = await asyncio.start_server(handle, host="127.0.0.1", port=0)
+        try:
+            return await generate_load(port=listener.sockets[0].getsockname()[1], connections=2, requests=20)
+        finally:
+            listener.close()
+            await listener.wait_closed()
+
+    report = asyncio.run(main())
+    assert report.errors == 20
+    assert report.latencies == []
+    assert report.cache_hit_rate is None
+
+
+def test_stats():
+    lines = [json.dumps({"id": i, "method": "validate", "query": "a: 1"}) for i in range(3)]
+
+    async def requests_then_stats(port):
+        await request_lines(port, lines)
+        return await request_lines(port, [json.dumps({"id": "s", "method": "stats"})])
+
+    _, responses = run_with_server(requests_then_stats)
+    stats = responses["s"]["result"]
+    assert stats["processed"] == 1
+    assert stats["cache_hits"] + stats["coalesced"] == 2
+
+
+def test_oversized_line():
+    oversized = json.dumps({"id": 1, "method": "validate", "query": " OR ".join(["a: 1"] * 10000)})
+    lines = [oversized, json.dumps({"id": 2, "method": "validate", "query": "a: 1"})]
+    _, responses = run_with_server(lambda port: request_lines(port, lines), line_limit=1024)
+
+    assert responses[None]["error"] == "Bad request: line is longer than 1024 bytes"
+    assert responses[2] == {"id": 2, "result": {"valid": True}}
+
+
+def test_backpressure(monkeypatch):
+    release = threading.Event()
+    handle_batch = server_module.handle_batch
+
+    def blocking_handle_batch(batch):
+        release.wait(timeout=10)
+        return handle_batch(batch)
+
+    monkeypatch.setattr(server_module, "handle_batch", blocking_handle_batch)
+    lines = [json.dumps({"id": i, "method": "validate", "query": f"a: {i}"}) for i in range(10)]
+
+    async def check(port, server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write("".join(line + "\n" for line in lines).encode())
+        await writer.drain()
+        await asyncio.sleep(0.1)
+
+        # one request in the running batch, one in the batch waiting for a slot, one in the queue,
+        # one waiting for a free place in the queue. Nothing else is read from the connection
+        assert server._queue.full()
+        assert len(server._in_flight) == 4
+        await asyncio.sleep(0.1)
+        assert len(server._in_flight) == 4
+
+        release.set()
+        responses = [json.loads(await reader.readline()) for _ in lines]
+        writer.close()
+        assert sorted(response["id"] for response in responses) == list(range(10))
+
+    async def main():
+        server = Server(max_batches=1, max_batch_size=1, max_pending=1, cache_size=0)
+        listener = await server.start_tcp()
+        try:
+            await check(listener.sockets[0].getsockname()[1], server)
+        finally:
+            release.set()
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_unix_socket():
+    async def main():
+        path = os.path.join(tempfile.mkdtemp(), "lucy.sock")
+        server = Server()
+        await server.start_unix(path)
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(json.dumps({"id": 1, "method": "validate", "query": "a: 1"}).encode() + b"\n")
+        response = json.loads(await reader.readline())
+        writer.close()
+        await server.close()
+        return path, response
+
+    path, response = asyncio.run(main())
+    assert response == {"id": 1, "result": {"valid": True}}
+    assert not os.path.exists(path)
+
+
+def test_close_resolves_pending_requests_and_keeps_foreign_executor(monkeypatch, caplog):
+    release = threading.Event()
+    handle_batch = server_module.handle_batch
+
+    def blocking_handle_batch(batch):
+        release.wait(timeout=10)
+        return handle_batch(batch)
+
+    monkeypatch.setattr(server_module, "handle_batch", blocking_handle_batch)
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def main():
+        server = Server(executor=executor, max_batches=1, max_batch_size=1)
+        listener = await server.start_tcp()
+        reader, writer = await asyncio.open_connection("127.0.0.1", listener.sockets[0].getsockname()[1])
+        for i in range(3):
+            writer.write(json.dumps({"id": i, "method": "validate", "query": f"a: {i}"}).encode() + b"\n")
+        await writer.drain()
+        await asyncio.sleep(0.1)
+
+        closing = asyncio.ensure_future(server.close())
+        await asyncio.sleep(0.1)
+        # the connection is not read any more, but writing to it is still fine
+        writer.write(json.dumps({"id": 3, "method": "validate", "query": "a: 3"}).encode() + b"\n")
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        release.set()
+        await closing
+        responses = [json.loads(await reader.readline()) for _ in range(3)]
+        assert await reader.readline() == b""
+        writer.close()
+        return {response["id"]: response for response in responses}
+
+    responses = asyncio.run(main())
+    assert responses[0] == {"id": 0, "result": {"valid": True}}
+    assert responses[1] == {"id": 1, "error": "Server is shutting down"}
+    assert responses[2] == {"id": 2, "error": "Server is shutting down"}
+    assert "Fatal error" not in caplog.text
+    assert executor.submit(lambda: 1).result() == 1
+    executor.shutdown()
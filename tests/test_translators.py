@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from lucyparser import parse
+from lucyparser.exceptions import LucyUndefinedOperator, LucyEmptyLogicalNode
+from lucyparser.translators import SQLTranslator, ElasticsearchTranslator, get_shape
+from lucyparser.tree import AndNode
+
+
+def test_shape_ignores_values():
+    assert get_shape(parse("a: 1 AND b > 2")) == get_shape(parse("a: x AND b > y"))
+    assert get_shape(parse("a: 1 AND b > 2")) != get_shape(parse("a: 1 AND b >= 2"))
+    assert get_shape(parse("a: 1 AND b > 2")) != get_shape(parse("a: 1 OR b > 2"))
+
+
+@pytest.mark.parametrize(
+    "paramstyle, query, template, params",
+    [
+        ("qmark", "a: 1", '"a" = ?', ["1"]),
+        ("qmark", "a.b ! x", '"a"."b" <> ?', ["x"]),
+        ("qmark", "a: 1 AND (b > 2 OR c <= 3)", '("a" = ? AND ("b" > ? OR "c" <= ?))', ["1", "2", "3"]),
+        ("format", "NOT a ~ 'x.*'", 'NOT ("a" ~ %s)', ["x.*"]),
+        ("numeric", "a: [1, 2] AND b >= 3", '(("a" = $1 OR "a" = $2) AND "b" >= $3)', ["1", "2", "3"]),
+    ],
+)
+def test_sql(paramstyle, query, template, params):
+    translation = SQLTranslator(paramstyle=paramstyle, match_operator="~").translate(parse(query))
+    assert translation.template == template
+    assert translation.params == params
+
+
+def test_sql_match_requires_operator():
+    with pytest.raises(LucyUndefinedOperator):
+        SQLTranslator().translate(parse("a ~ 'x.*'"))
+    assert SQLTranslator(match_operator="REGEXP").translate(parse("a ~ 'x.*'")).template == '"a" REGEXP ?'
+
+
+@pytest.mark.parametrize("translator", [SQLTranslator(), ElasticsearchTranslator()])
+def test_empty_logical_node(translator):
+    with pytest.raises(LucyEmptyLogicalNode):
+        translator.translate(AndNode(children=[]))
+
+
+def test_sql_unknown_paramstyle():
+    with pytest.raises(ValueError):
+        SQLTranslator(paramstyle="named")
+
+
+def test_elasticsearch():
+    translation = ElasticsearchTranslator().translate(parse("a: 1 AND (b > 2 OR NOT c ! 3)"))
+    assert json.loads(translation.template) == {
+        "bool": {"must": [
+            {"term": {"a": "{{p0}}"}},
+            {"bool": {"should": [
+                {"range": {"b": {"gt": "{{p1}}"}}},
+                {"bool": {"must_not": [{"bool": {"must_not": [{"term": {"c": "{{p2}}"}}]}}]}},
+            ], "minimum_should_match": 1}},
+        ]}
+    }
+    assert translation.params == {"p0": "1", "p1": "2", "p2": "3"}
+
+
+@pytest.mark.parametrize("translator", [SQLTranslator(), ElasticsearchTranslator()])
+def test_templates_are_cached_by_shape(translator):
+    first = translator.translate(parse("a: 1 AND b < 2"))
+    second = translator.translate(parse("a: 'other value' AND b < 100"))
+    assert first.template is second.template
+    assert first.params != second.params
+    assert translator.render.cache_info().hits == 1